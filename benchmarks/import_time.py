@@ -0,0 +1,84 @@
+"""Startup-time benchmark for `import fynesse`.
+
+Each scenario runs in a fresh interpreter (so nothing is cached in sys.modules), repeated a few times;
+the median wall-clock time is reported along with which of the heavy dependencies ended up loaded.
+The "eager" scenario imports everything the package used to import up front, for comparison; any of those
+modules that aren't installed are skipped (and listed), so the comparison is only fair where all are present.
+
+    python benchmarks/import_time.py [--repeats N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY = ["osmnx", "geopandas", "osmium", "pyproj", "sklearn", "scipy", "matplotlib", "tqdm", "pymysql", "pandas"]
+
+# the module-level imports of fynesse/__init__.py, access.py, assess.py and address.py before they became lazy
+BASELINE_IMPORTS = ["requests", "pymysql", "csv", "time", "osmnx", "math", "os", "warnings", "pyproj", "osmium",
+                    "tqdm", "yaml", "pandas", "contextlib", "numpy", "geopandas", "matplotlib.pyplot", "shapely",
+                    "scipy.stats", "sklearn.linear_model"]
+
+EAGER = f"""
+import importlib
+import fynesse
+missing = []
+for module in {BASELINE_IMPORTS!r}:
+  try:
+    importlib.import_module(module)
+  except ImportError:
+    missing.append(module)
+fynesse.access; fynesse.assess; fynesse.address
+"""
+
+SCENARIOS = {
+  "import fynesse": "import fynesse",
+  "fynesse.access": "import fynesse; fynesse.access",
+  "fynesse.assess": "import fynesse; fynesse.assess",
+  "fynesse.address": "import fynesse; fynesse.address",
+  "eager (previous behaviour)": EAGER,
+}
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+print(",".join(globals().get("missing", [])))
+"""
+
+
+def time_scenario(statement, repeats):
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  times, loaded = [], ""
+  for _ in range(repeats):
+    out = subprocess.run([sys.executable, "-c", PROBE.format(statement=statement, heavy=HEAVY)],
+                         cwd=root, capture_output=True, text=True)
+    if out.returncode != 0:
+      return None, out.stderr.strip().splitlines()[-1], ""
+    elapsed, loaded, missing = out.stdout.splitlines()[-3:]
+    times.append(float(elapsed))
+  return statistics.median(times), loaded, missing
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--repeats", type=int, default=5)
+  args = parser.parse_args()
+
+  width = max(len(name) for name in SCENARIOS)
+  print(f"{'scenario':<{width}}  {'median s':>9}  heavy modules loaded")
+  for name, statement in SCENARIOS.items():
+    seconds, loaded, missing = time_scenario(statement, args.repeats)
+    if seconds is None:
+      print(f"{name:<{width}}  {'failed':>9}  {loaded}")
+    else:
+      print(f"{name:<{width}}  {seconds:>9.3f}  {loaded or '-'}" + (f" (not installed: {missing})" if missing else ""))
+
+
+if __name__ == "__main__":
+  main()
@@ -1,3 +1,17 @@
-from . import access
-from . import assess
-from . import address
+# access, assess and address are only imported on first use (PEP 562), so that `import fynesse`
+# doesn't load geopandas/osmnx/sklearn etc. for jobs that never need them.
+import importlib
+
+__all__ = ["access", "assess", "address", "grid", "locations", "profiling"]
+
+
+def __getattr__(name):
+  if name in __all__:
+    module = importlib.import_module(f".{name}", __name__)
+    globals()[name] = module
+    return module
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+  return sorted(list(globals()) + __all__)
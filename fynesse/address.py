@@ -1,34 +1,38 @@
 # This file contains code for suporting addressing questions in the data
 
-from scipy.stats import pearsonr
-from sklearn.linear_model import LinearRegression
 import numpy as np
 from . import assess
+from . import profiling
 
 
 
 
+@profiling.profiled
 def greenProportion_join_meanPrice(conn, year):
   greenGDF = assess.green_proportion_by_constituency(conn, year)
   priceDF = assess.mean_price_by_constituency(conn, year).drop(columns=["geom"]) # we don't need two identical geoms
   return priceDF.join(greenGDF, how="inner").astype({"green_proportion":float, "mean_price":float})
 
 
+@profiling.profiled
 def greenProportion_join_numSales(conn, year):
   greenGDF = assess.green_proportion_by_constituency(conn, year)
   numSalesDF = assess.num_sales_by_constituency(conn, year).drop(columns=["geom"]) # we (again) don't need two identical geoms
   return numSalesDF.join(greenGDF, how="inner").astype({"green_proportion":float, "num_sales":int})
 
 
+@profiling.profiled
 def greenProportion_join_priceStDev(conn, year):
   greenGDF = assess.green_proportion_by_constituency(conn, year)
   priceStDevDF = assess.price_stdev_by_constituency(conn, year).drop(columns=["geom"]) # we (still) don't need two identical geoms
   return priceStDevDF.join(greenGDF, how="inner").astype({"green_proportion":float, "price_stdev":float})
 
 
+@profiling.profiled
 def GLM_predict(frame, fit_intercept=True, print_coefs=False):
   """Returns the predictions of a created (Generalised) Linear Model for a given DataFrame,
      whose final column should contain the target variable."""
+  from sklearn.linear_model import LinearRegression
   fitted = LinearRegression(fit_intercept=fit_intercept).fit(frame.iloc[:,:-1].to_numpy(),
                                                              frame.iloc[:,-1].to_numpy().reshape(-1, 1))
   intercept = fitted.intercept_[0] if fit_intercept else 0
@@ -45,6 +49,8 @@ def GLM_predict(frame, fit_intercept=True, print_coefs=False):
 
 def scatter(ax, predictions, actual, xlabel="", ylabel=""):
   """`predictions` and `actual` should be DataFrames"""
+  from scipy.stats import pearsonr
+  from sklearn.linear_model import LinearRegression
   
   ax.scatter(predictions, actual)
 
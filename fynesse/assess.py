@@ -3,12 +3,12 @@ import contextlib
 import warnings
 import numpy as np
 from math import cos, radians
-import osmnx as ox
 import pandas as pd
 import geopandas as gpd
-import matplotlib.pyplot as plt
 import pymysql
 import shapely
+from . import profiling
+from .profiling import span
 
 """
 Place commands in this file to assess the data you have downloaded. How are missing values encoded, how are outliers encoded?
@@ -34,16 +34,19 @@ def resultsToGDF(results, geomColumnName="geom", flip_lat_lon=False, columns=Non
   else:
     gdf = gpd.GeoDataFrame(results, columns=columns).set_index(0 if columns is None else columns[0])
 
-  if flip_lat_lon:
-    gdf.loc[:, geomColumnName] = gdf.loc[:, geomColumnName].apply(
-                    lambda geomString: shapely.ops.transform(lambda x, y: (y, x), shapely.from_wkt(geomString)))
-  else:
-    gdf.loc[:, geomColumnName] = gdf.loc[:, geomColumnName].apply(lambda geomString: shapely.from_wkt(geomString))
+  with span("wkt.parse", rows=len(gdf.index)):
+    if flip_lat_lon:
+      gdf.loc[:, geomColumnName] = gdf.loc[:, geomColumnName].apply(
+                      lambda geomString: shapely.ops.transform(lambda x, y: (y, x), shapely.from_wkt(geomString)))
+    else:
+      gdf.loc[:, geomColumnName] = gdf.loc[:, geomColumnName].apply(lambda geomString: shapely.from_wkt(geomString))
 
-  return gdf.set_geometry(col=geomColumnName).set_crs("EPSG:4326").to_crs(crs="EPSG:27700")
+  with span("crs.reproject", rows=len(gdf.index)):
+    return gdf.set_geometry(col=geomColumnName).set_crs("EPSG:4326").to_crs(crs="EPSG:27700")
 
 
 
+@profiling.profiled
 def load_oa_features(conn, columns):
   """Returns a GeoDataFrame of ([oa_code, boundary_geom, total, l15, prop_moved, column1, column2...,], ...)
      where at least one specified column is neither null nor zero."""
@@ -55,9 +58,13 @@ def load_oa_features(conn, columns):
     return -1
 
   cur = conn.cursor()
-  results = cur.execute(f"""SELECT oa,ST_AsText(boundary),total,l15,prop_moved,{','.join(columns)} FROM census2021_ts062_oa
-                            WHERE {' OR '.join(f'({column} IS NOT NULL AND {column} != 0)' for column in columns)}""")
-  gdf = resultsToGDF(cur.fetchall(), geomColumnName="boundary", flip_lat_lon=True,
+  with span("sql.execute"):
+    results = cur.execute(f"""SELECT oa,ST_AsText(boundary),total,l15,prop_moved,{','.join(columns)} FROM census2021_ts062_oa
+                              WHERE {' OR '.join(f'({column} IS NOT NULL AND {column} != 0)' for column in columns)}""")
+  with span("sql.fetch") as s:
+    rows = cur.fetchall()
+    s.add(rows=len(rows))
+  gdf = resultsToGDF(rows, geomColumnName="boundary", flip_lat_lon=True,
                      columns=["ons_id", "boundary", "total", "l15", "prop_moved"]+columns)
   return gdf
 
@@ -68,6 +75,7 @@ pcd_year_delimiters = {2024: 34, 2023: 393244,   2022: 1179664,  2021: 2293759,
                                  2018: 5767114,  2017: 6815674,  2016: 7929769,  2015: 8978329,  2014: 10944379,
                                  2013: 11992939, 2012: 12844894, 2011: 13565779, 2010: 14679874, 2009: 15400759}
 
+@profiling.profiled
 def mean_price_by_constituency(conn, year):
   """Returns the mean price of a house-sale in a given constituency, for a given year.
      The constituency boundaries to be used are the ones which were in place for the most
@@ -88,20 +96,24 @@ def mean_price_by_constituency(conn, year):
 
   cur = conn.cursor()
 
-  cur.execute(f"""
-      SELECT p.ons_id, mean_price, ST_AsText(geometry) as geom FROM
-         (SELECT ons_id{boundary_category} as ons_id, AVG(price) as mean_price FROM prices_coordinates_data
-          WHERE db_id BETWEEN {pcd_year_delimiters[year]} AND {pcd_year_delimiters[year-1]-1}
-          AND ons_id{boundary_category} IS NOT NULL
-          GROUP BY ons_id{boundary_category}) p
-      JOIN boundaries{boundary_category} b ON b.ONS_ID = p.ons_id""")
-
-  priceResults = cur.fetchall()
+  with span("sql.execute"):
+    cur.execute(f"""
+        SELECT p.ons_id, mean_price, ST_AsText(geometry) as geom FROM
+           (SELECT ons_id{boundary_category} as ons_id, AVG(price) as mean_price FROM prices_coordinates_data
+            WHERE db_id BETWEEN {pcd_year_delimiters[year]} AND {pcd_year_delimiters[year-1]-1}
+            AND ons_id{boundary_category} IS NOT NULL
+            GROUP BY ons_id{boundary_category}) p
+        JOIN boundaries{boundary_category} b ON b.ONS_ID = p.ons_id""")
+
+  with span("sql.fetch") as s:
+    priceResults = cur.fetchall()
+    s.add(rows=len(priceResults))
   priceGDF = resultsToGDF(priceResults, columns=["ons_id", "mean_price", "geom"])
   return priceGDF.astype({"mean_price":float})
 
 
 
+@profiling.profiled
 def green_proportion_by_constituency(conn, year):
   """Returns the proportion of valid votes for each constituency that were for the Green party,
      for a given election year."""
@@ -119,9 +131,12 @@ def green_proportion_by_constituency(conn, year):
     boundary_category = "2010_to_2019"
 
   cur = conn.cursor()
-  cur.execute(f"""SELECT g.ONS_ID as ons_id, g.proportion{year} as green_proportion, ST_AsText(geometry) as geom
-                  FROM boundaries{boundary_category} b JOIN green_proportion{boundary_category} g ON b.ONS_ID = g.ONS_ID""")
-  greenResults = cur.fetchall()
+  with span("sql.execute"):
+    cur.execute(f"""SELECT g.ONS_ID as ons_id, g.proportion{year} as green_proportion, ST_AsText(geometry) as geom
+                    FROM boundaries{boundary_category} b JOIN green_proportion{boundary_category} g ON b.ONS_ID = g.ONS_ID""")
+  with span("sql.fetch") as s:
+    greenResults = cur.fetchall()
+    s.add(rows=len(greenResults))
   greenGDF = resultsToGDF(greenResults, columns=["ons_id", "green_proportion", "geom"])
   return greenGDF.astype({"green_proportion":float})
 
@@ -130,6 +145,7 @@ def adjust_zeros(series):
 
 
 
+@profiling.profiled
 def num_sales_by_constituency(conn, year):
   """Returns the total number of house sales in a given constituency, in a given year.
      The constituency boundaries to be used are the ones which were in place for the most
@@ -150,19 +166,23 @@ def num_sales_by_constituency(conn, year):
 
   cur = conn.cursor()
 
-  cur.execute(f"""
-      SELECT p.ons_id, num_sales, ST_AsText(geometry) as geom FROM
-         (SELECT ons_id{boundary_category} as ons_id, COUNT(*) as num_sales FROM prices_coordinates_data
-          WHERE db_id BETWEEN {pcd_year_delimiters[year]} AND {pcd_year_delimiters[year-1]-1}
-          AND ons_id{boundary_category} IS NOT NULL
-          GROUP BY ons_id{boundary_category}) p
-      JOIN boundaries{boundary_category} b ON b.ONS_ID = p.ons_id""")
-
-  numSalesResults = cur.fetchall()
+  with span("sql.execute"):
+    cur.execute(f"""
+        SELECT p.ons_id, num_sales, ST_AsText(geometry) as geom FROM
+           (SELECT ons_id{boundary_category} as ons_id, COUNT(*) as num_sales FROM prices_coordinates_data
+            WHERE db_id BETWEEN {pcd_year_delimiters[year]} AND {pcd_year_delimiters[year-1]-1}
+            AND ons_id{boundary_category} IS NOT NULL
+            GROUP BY ons_id{boundary_category}) p
+        JOIN boundaries{boundary_category} b ON b.ONS_ID = p.ons_id""")
+
+  with span("sql.fetch") as s:
+    numSalesResults = cur.fetchall()
+    s.add(rows=len(numSalesResults))
   numSalesGDF = resultsToGDF(numSalesResults, columns=["ons_id", "num_sales", "geom"])
   return numSalesGDF
 
 
+@profiling.profiled
 def price_stdev_by_constituency(conn, year):
   """Returns the standard deviation in the prices of house-sales in a given constituency, for a given year.
      The constituency boundaries to be used are the ones which were in place for the most
@@ -183,35 +203,44 @@ def price_stdev_by_constituency(conn, year):
 
   cur = conn.cursor()
 
-  cur.execute(f"""
-      SELECT p.ons_id, price_stdev, ST_AsText(geometry) as geom FROM
-         (SELECT ons_id{boundary_category} as ons_id, STDDEV_POP(price) as price_stdev FROM prices_coordinates_data
-          WHERE db_id BETWEEN {pcd_year_delimiters[year]} AND {pcd_year_delimiters[year-1]-1}
-          AND ons_id{boundary_category} IS NOT NULL
-          GROUP BY ons_id{boundary_category}) p
-      JOIN boundaries{boundary_category} b ON b.ONS_ID = p.ons_id""")
-
-  priceStDevResults = cur.fetchall()
+  with span("sql.execute"):
+    cur.execute(f"""
+        SELECT p.ons_id, price_stdev, ST_AsText(geometry) as geom FROM
+           (SELECT ons_id{boundary_category} as ons_id, STDDEV_POP(price) as price_stdev FROM prices_coordinates_data
+            WHERE db_id BETWEEN {pcd_year_delimiters[year]} AND {pcd_year_delimiters[year-1]-1}
+            AND ons_id{boundary_category} IS NOT NULL
+            GROUP BY ons_id{boundary_category}) p
+        JOIN boundaries{boundary_category} b ON b.ONS_ID = p.ons_id""")
+
+  with span("sql.fetch") as s:
+    priceStDevResults = cur.fetchall()
+    s.add(rows=len(priceStDevResults))
   priceStDevGDF = resultsToGDF(priceStDevResults, columns=["ons_id", "price_stdev", "geom"])
   return priceStDevGDF.astype({"price_stdev":float})
   
 
 
 
+@profiling.profiled
 def get_buildings(north, south, east, west):
-  with warnings.catch_warnings():
+  import osmnx as ox
+  with warnings.catch_warnings(), span("network.overpass") as s:
     warnings.simplefilter("ignore")
     buildings = ox.geometries_from_bbox(north, south, east, west, {"building": True})
+    s.add(rows=len(buildings.index))
   buildings["full_addr"] = buildings["addr:housenumber"].notnull() & buildings["addr:street"].notnull() & buildings["addr:postcode"].notnull()
   previous_crs = buildings.crs
-  buildings = buildings.to_crs("epsg:3857")
-  buildings["area"] = buildings["geometry"].area
-  buildings = buildings.to_crs(previous_crs)
+  with span("crs.reproject", rows=len(buildings.index)):
+    buildings = buildings.to_crs("epsg:3857")
+    buildings["area"] = buildings["geometry"].area
+    buildings = buildings.to_crs(previous_crs)
   return buildings[["addr:housenumber", "addr:street", "addr:postcode", "full_addr", "area", "geometry"]]
 
 
 
 def plot_buildings(north, south, east, west, buildings):
+  import osmnx as ox
+  import matplotlib.pyplot as plt
   fig, ax = plt.subplots()
   with warnings.catch_warnings():
     warnings.simplefilter("ignore")
@@ -237,6 +266,7 @@ def plot_buildings(north, south, east, west, buildings):
 
 
 
+@profiling.profiled
 def merge_with_prices(addressed_buildings): # this mutates the input, so there is no return
   conn = access.create_connection_default()
   cur = conn.cursor()
@@ -247,10 +277,11 @@ def merge_with_prices(addressed_buildings): # this mutates the input, so there i
     street_name = addressed_buildings.iloc[i].get("addr:street").upper()
     house_number = addressed_buildings.iloc[i].get("addr:housenumber")
     # Attempting to find {house_number}, {street_name}
-    with contextlib.redirect_stdout(None):
+    with contextlib.redirect_stdout(None), span("sql.execute") as s:
         
       cur.execute(f"SELECT * FROM pp_data WHERE date_of_transfer >= '2020-01-01' AND (postcode='{current_postcode}')")
       whole_postcode = cur.fetchall()
+      s.add(rows=len(whole_postcode))
     if not whole_postcode:
       # Nothing at all found in the postcode
       continue
@@ -0,0 +1,303 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# This file runs the heavy lifting from the command line (e.g. on a batch node), rather than from Colab
+
+"""Usage examples:
+     fynesse --jobs 4 download 2019-2023
+     fynesse --jobs 3 ingest 2019 2020 2021   (the joins run in parallel; the loads one year at a time)
+     fynesse --jobs 8 aggregate mean_price 2015-2024 --out aggregates/
+     fynesse --jobs 8 grid 1995-2024 --out grids/
+     fynesse locations uk.osm.pbf --tag amenity=nightclub --out nightclubs.parquet
+     fynesse --jobs 4 upload census_*.parquet --table census2021_ts062_oa --disable-keys
+   Database credentials come from fynesse/other/config.py (password from $FYNESSE_DB_PASSWORD);
+   each job opens its own connection, so they can run in separate processes.
+   `upload --disable-keys` drops the table's secondary indexes (DISABLE KEYS, on MyISAM/Aria) once before
+   all the files are loaded, and rebuilds them once afterwards (printing the statement to restore them by hand
+   first, in case the run dies in between). `upload --skip-checks` turns off unique/foreign key checks.
+   `--profile out.json` records profiling spans in every job and merges them into out.json."""
+
+
+
+AGGREGATES = {"mean_price": "mean_price_by_constituency",
+              "num_sales": "num_sales_by_constituency",
+              "price_stdev": "price_stdev_by_constituency",
+              "green_proportion": "green_proportion_by_constituency"}
+
+
+def parse_year_range(value):
+  """Turns e.g. "2018-2020" into [2018, 2019, 2020], and "2015" into [2015]; used as an argparse type."""
+  try:
+    if "-" in value:
+      year_from, year_to = (int(year) for year in value.split("-"))
+    else:
+      year_from = year_to = int(value)
+  except ValueError:
+    raise argparse.ArgumentTypeError(f"years should look like 2015 or 2015-2020, not {value!r}")
+  if year_from > year_to:
+    raise argparse.ArgumentTypeError(f"reversed year range {value!r}; did you mean {year_to}-{year_from}?")
+  return list(range(year_from, year_to+1))
+
+
+def parse_years(ranges):
+  """Flattens the lists from parse_year_range, e.g. [[2015], [2018, 2019, 2020]], into sorted unique years."""
+  return sorted(set(year for years in ranges for year in years))
+
+
+def parse_tag(value):
+  """Turns e.g. "building=dormitory" into ("building", "dormitory"); repeated --tag options make the dict for get_locations."""
+  key, _, tag_value = value.partition("=")
+  if not key or not tag_value:
+    raise argparse.ArgumentTypeError(f"tags should look like key=value, not {value!r}")
+  return key, tag_value
+
+
+def _connect():
+  from . import access
+  conn = access.create_connection_from_config()
+  if conn is None:
+    raise RuntimeError("Could not connect to the database.")
+  return conn
+
+
+def run_download(year):
+  from . import access
+  access.download_price_paid_data(year, year)
+  return f"pp-{year}-part1.csv, pp-{year}-part2.csv"
+
+
+def run_ingest_select(year, csv_file_path):
+  from . import access
+  conn = _connect()
+  try:
+    access.housing_select_join_data(conn, year, csv_file_path)
+  except Exception:
+    if os.path.exists(csv_file_path):
+      os.remove(csv_file_path)
+    raise
+  finally:
+    conn.close()
+  return csv_file_path
+
+
+def run_ingest_load(year, csv_file_path):
+  from . import access
+  conn = _connect()
+  try:
+    access.housing_load_join_data(conn, year, csv_file_path)
+  finally:
+    conn.close()
+    os.remove(csv_file_path)
+  return "prices_coordinates_data"
+
+
+def run_aggregate(metric, year, out_dir):
+  from . import assess
+  conn = _connect()
+  try:
+    gdf = getattr(assess, AGGREGATES[metric])(conn, year)
+  finally:
+    conn.close()
+  if gdf is None:
+    raise ValueError(f"No {metric} data for {year}.")
+  path = os.path.join(out_dir, f"{metric}_by_constituency_{year}.parquet")
+  gdf.to_parquet(path)
+  return path
+
+
+def run_grid(year, out_dir):
+  from .grid import PriceGrid
+  conn = _connect()
+  grid = PriceGrid()
+  try:
+    grid.add_year(conn, year)
+  finally:
+    conn.close()
+  return grid.save(os.path.join(out_dir, f"price_grid_{year}.npz"))
+
+
+def run_locations(source, tags, out):
+  from . import access
+  filtered_path = f"{out}.filtered.osm.pbf"
+  try:
+    locations = access.get_locations(source, tags, filtered_path=filtered_path)
+  finally:
+    if os.path.exists(filtered_path):
+      os.remove(filtered_path)
+  locations.to_pandas().to_parquet(out)
+  return out
+
+
+def run_upload(path, table, chunk_rows, srid, skip_checks):
+  import pandas as pd
+  from . import access
+  if path.endswith(".csv"):
+    df = pd.read_csv(path)
+  else:
+    try:
+      import geopandas as gpd
+      df = gpd.read_parquet(path)
+    except (ImportError, ValueError):  # not GeoParquet (or no geopandas): a plain table
+      df = pd.read_parquet(path)
+  conn = _connect()
+  try:
+    stats = access.upload_dataframe(conn, df, table, chunk_rows=chunk_rows, srid=srid, skip_checks=skip_checks)
+  finally:
+    conn.close()
+  return f"{stats['rows']} rows, {stats['rows_per_s']:.0f} rows/s"
+
+
+def _run_job(func, arguments, profile_path):
+  """Runs one job; if profile_path is given, with profiling on, writing its spans there (even if it fails)."""
+  if profile_path is None:
+    return func(*arguments)
+  from . import profiling
+  profiling.reset()
+  profiling.enable()
+  try:
+    return func(*arguments)
+  finally:
+    profiling.export_json(profile_path)
+
+
+def run_jobs(jobs, func, argument_lists, profile=None):
+  """Runs func(*arguments) for each of argument_lists, in up to `jobs` processes (in order if jobs is 1).
+     Returns the list of arguments whose jobs succeeded. If `profile` is a path, each job's spans are
+     recorded and merged into that JSON file at the end."""
+  succeeded = []
+  profile_paths = [None if profile is None else f"{profile}.{func.__name__}.part{i}" for i in range(len(argument_lists))]
+  try:
+    if jobs <= 1 or len(argument_lists) <= 1:
+      for arguments, profile_path in zip(argument_lists, profile_paths):
+        try:
+          print(f"Done {arguments}: {_run_job(func, arguments, profile_path)}")
+          succeeded.append(arguments)
+        except Exception as e:
+          print(f"Failed {arguments}: {e}")
+    else:
+      with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(_run_job, func, arguments, profile_path): arguments
+                   for arguments, profile_path in zip(argument_lists, profile_paths)}
+        for future in as_completed(futures):
+          try:
+            print(f"Done {futures[future]}: {future.result()}")
+            succeeded.append(futures[future])
+          except Exception as e:
+            print(f"Failed {futures[future]}: {e}")
+  finally:
+    if profile is not None:
+      _merge_profiles(profile, [(path, arguments) for path, arguments in zip(profile_paths, argument_lists)
+                                if os.path.exists(path)])
+  return succeeded
+
+
+def _merge_profiles(profile, parts):
+  """Merges the per-job files written by _run_job into `profile` (adding to it, if an earlier
+     phase of the same command already wrote it; main() clears it first), and removes them."""
+  from . import profiling
+  profiling.reset()
+  if os.path.exists(profile):
+    profiling.import_json(profile)
+  for path, arguments in parts:
+    profiling.import_json(path, label=", ".join(map(str, arguments)))
+    os.remove(path)
+  profiling.export_json(profile)
+  print(f"Profile of {len(parts)} job(s) written to {profile}")
+  profiling.report()
+
+
+def build_parser():
+  parser = argparse.ArgumentParser(prog="fynesse", description="Run fynesse ingest/aggregate jobs non-interactively.")
+  parser.add_argument("--jobs", "-j", type=int, default=1, help="number of processes to run in parallel")
+  parser.add_argument("--profile", metavar="OUT.json", default=None,
+                      help="record profiling spans in every job and write them (merged) to this file")
+  commands = parser.add_subparsers(dest="command", required=True)
+
+  download = commands.add_parser("download", help="download price-paid CSVs into the current directory")
+  download.add_argument("years", nargs="+", type=parse_year_range, help="years, or ranges such as 2015-2020")
+
+  ingest = commands.add_parser("ingest", help="join pp_data with postcode_data into prices_coordinates_data")
+  ingest.add_argument("years", nargs="+", type=parse_year_range, help="years, or ranges such as 2015-2020")
+
+  aggregate = commands.add_parser("aggregate", help="export a *_by_constituency aggregate to Parquet")
+  aggregate.add_argument("metric", choices=sorted(AGGREGATES))
+  aggregate.add_argument("years", nargs="+", type=parse_year_range, help="years, or ranges such as 2015-2020")
+  aggregate.add_argument("--out", default=".", help="output directory")
+
+  grid = commands.add_parser("grid", help="build per-year price grids (PriceGrid.load merges the files)")
+  grid.add_argument("years", nargs="+", type=parse_year_range, help="years, or ranges such as 2015-2020")
+  grid.add_argument("--out", default=".", help="output directory")
+  grid.add_argument("--rebuild", action="store_true", help="rebuild years whose grid file already exists")
+
+  upload = commands.add_parser("upload", help="bulk-load .parquet/.csv files into an existing table")
+  upload.add_argument("paths", nargs="+", help=".parquet (GeoParquet geometry is sent as WKB) or .csv files")
+  upload.add_argument("--table", required=True)
+  upload.add_argument("--chunk-rows", type=int, default=100000)
+  upload.add_argument("--srid", type=int, default=None, help="SRID for the geometry column")
+  upload.add_argument("--disable-keys", action="store_true", help="drop secondary indexes (InnoDB) or DISABLE KEYS (MyISAM/Aria) during the "
+                      "load, and rebuild them once after all files are loaded")
+  upload.add_argument("--skip-checks", action="store_true",
+                      help="turn off unique/foreign key checks while loading: faster, but duplicate rows or rows "
+                      "breaking a foreign key may then load silently")
+
+  locations = commands.add_parser("locations", help="extract (lat, lon) of tagged OSM objects to Parquet")
+  locations.add_argument("source", help=".osm.pbf file")
+  locations.add_argument("--tag", action="append", required=True, dest="tags", type=parse_tag,
+                         help="key=value (repeatable)")
+  locations.add_argument("--out", required=True, help="output .parquet file")
+  return parser
+
+
+def main(argv=None):
+  args = build_parser().parse_args(argv)
+  jobs = args.jobs
+  if args.profile is not None and os.path.exists(args.profile):
+    os.remove(args.profile)
+
+  if args.command == "download":
+    func, argument_lists = run_download, [(year,) for year in parse_years(args.years)]
+  elif args.command == "ingest":
+    # The joins can run in parallel, but the LOAD DATAs must not: each year has to occupy one contiguous
+    # db_id range of prices_coordinates_data (see assess.pcd_year_delimiters), so they run one at a time,
+    # newest year first, as the table was originally built.
+    years = parse_years(args.years)
+    selected = run_jobs(jobs, run_ingest_select, [(year, f"output_file_{year}_{os.getpid()}.csv") for year in years],
+                        profile=args.profile)
+    loaded = run_jobs(1, run_ingest_load, sorted(selected, reverse=True), profile=args.profile)
+    return 0 if len(loaded) == len(years) else 1
+  elif args.command == "aggregate":
+    os.makedirs(args.out, exist_ok=True)
+    func, argument_lists = run_aggregate, [(args.metric, year, args.out) for year in parse_years(args.years)]
+  elif args.command == "grid":
+    os.makedirs(args.out, exist_ok=True)
+    years = [year for year in parse_years(args.years)
+             if args.rebuild or not os.path.exists(os.path.join(args.out, f"price_grid_{year}.npz"))]
+    func, argument_lists = run_grid, [(year, args.out) for year in years]
+  elif args.command == "upload":
+    argument_lists = [(path, args.table, args.chunk_rows, args.srid, args.skip_checks) for path in args.paths]
+    if not args.disable_keys:
+      succeeded = run_jobs(jobs, run_upload, argument_lists, profile=args.profile)
+      return 0 if len(succeeded) == len(argument_lists) else 1
+    # the indexes are dropped and rebuilt here, once, rather than by each (possibly concurrent) upload job
+    from . import access
+    conn = _connect()
+    try:
+      index_state = access.disable_indexes(conn, args.table)
+      try:
+        succeeded = run_jobs(jobs, run_upload, argument_lists, profile=args.profile)
+      finally:
+        access.rebuild_indexes(conn, index_state)
+    finally:
+      conn.close()
+    return 0 if len(succeeded) == len(argument_lists) else 1
+  else:
+    func, argument_lists, jobs = run_locations, [(args.source, dict(args.tags), args.out)], 1
+
+  succeeded = run_jobs(jobs, func, argument_lists, profile=args.profile)
+  return 0 if len(succeeded) == len(argument_lists) else 1
+
+
+if __name__ == "__main__":
+  sys.exit(main())
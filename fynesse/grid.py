@@ -0,0 +1,263 @@
+import numpy as np
+from math import log
+from .access import make_box
+from .profiling import profiled, span
+
+# This file precomputes price surfaces, so that local price questions don't need a fresh scan of prices_coordinates_data
+
+"""A PriceGrid holds, per (year, property_type, resolution), the count/sum/sum-of-squares of prices in each
+square cell of the British National Grid (EPSG:27700), plus a log-bucketed histogram of prices per cell
+(a quantile sketch, accurate to about SKETCH_GAMMA). Bbox and radius queries sum the cells whose centres fall
+inside the region, so their accuracy is limited by the cell size; the finest resolution is used by default.
+Cell keys are kept sorted, so a query binary-searches for the cells in the region's bounding box and reads only
+those: its cost grows with the size of the region, not of the grid."""
+
+
+
+RESOLUTIONS = (100, 1000)  # cell side lengths, in metres
+SKETCH_GAMMA = 1.02        # ratio between consecutive sketch bins, so quantiles are within ~1%
+
+_FIELDS = ("cell", "count", "sum", "sumsq", "sketch_cell", "sketch_bin", "sketch_count")
+_BIN_STRIDE = 1 << 16  # sketch (cell, bin) pairs are packed into one int64 as cell*_BIN_STRIDE + bin
+
+
+def _to_bng(lat, lon):
+  """Vectorised lat/lon (EPSG:4326) -> eastings/northings (EPSG:27700)."""
+  if not hasattr(_to_bng, "transformer"):
+    from pyproj import Transformer
+    _to_bng.transformer = Transformer.from_crs("epsg:4326", "epsg:27700", always_xy=True)
+  with span("crs.reproject", rows=np.size(lat)):
+    return _to_bng.transformer.transform(np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+
+
+def _cell_keys(x, y, resolution):
+  ix = np.floor(np.asarray(x) / resolution).astype(np.int64)
+  iy = np.floor(np.asarray(y) / resolution).astype(np.int64)
+  return ix * (1 << 32) + (iy + (1 << 31))
+
+
+def _cell_centres(keys, resolution):
+  ix = keys // (1 << 32)
+  iy = keys % (1 << 32) - (1 << 31)
+  return (ix + 0.5) * resolution, (iy + 0.5) * resolution
+
+
+def _ranges(starts, ends):
+  """Concatenates np.arange(start, end) for each pair, without a Python loop."""
+  lengths = ends - starts
+  keep = lengths > 0
+  starts, lengths = starts[keep], lengths[keep]
+  if len(starts) == 0:
+    return np.zeros(0, dtype=np.int64)
+  offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+  return offsets + np.arange(lengths.sum())
+
+
+def _cells_in_box(cells, x_low, x_high, y_low, y_high, resolution):
+  """Indices into the (sorted) cell keys of the cells whose centres lie in the box. Keys are ordered by ix, then
+     iy, so each column of the box is one contiguous run, found by binary search; other cells are never touched."""
+  ix = np.arange(np.ceil(x_low / resolution - 0.5), np.floor(x_high / resolution - 0.5) + 1).astype(np.int64)
+  iy_low = int(np.ceil(y_low / resolution - 0.5))
+  iy_high = int(np.floor(y_high / resolution - 0.5))
+  if len(ix) == 0 or iy_low > iy_high:
+    return np.zeros(0, dtype=np.int64)
+  starts = np.searchsorted(cells, ix * (1 << 32) + (iy_low + (1 << 31)), side="left")
+  ends = np.searchsorted(cells, ix * (1 << 32) + (iy_high + (1 << 31)), side="right")
+  return _ranges(starts, ends)
+
+
+def _sketch_bins(prices):
+  return np.floor(np.log(np.maximum(prices, 1)) / log(SKETCH_GAMMA)).astype(np.int64)
+
+
+def _aggregate(cell, price_weights, sketch_cell_keys, sketch_bins, sketch_counts):
+  """Builds a layer from (possibly repeated) cell keys, where price_weights = (count, sum, sumsq) per entry."""
+  cells, inverse = np.unique(cell, return_inverse=True)
+  count, total, sumsq = (np.bincount(inverse, weights=w, minlength=len(cells)) for w in price_weights)
+  packed = np.searchsorted(cells, sketch_cell_keys) * _BIN_STRIDE + sketch_bins
+  sketch, sketch_inverse = np.unique(packed, return_inverse=True)
+  return {"cell": cells, "count": count.astype(np.int64), "sum": total, "sumsq": sumsq,
+          "sketch_cell": (sketch // _BIN_STRIDE).astype(np.int32),
+          "sketch_bin": (sketch % _BIN_STRIDE).astype(np.int16),
+          "sketch_count": np.bincount(sketch_inverse, weights=sketch_counts, minlength=len(sketch)).astype(np.int64)}
+
+
+def _merge(a, b):
+  return _aggregate(np.concatenate([a["cell"], b["cell"]]),
+                    [np.concatenate([a[f], b[f]]) for f in ("count", "sum", "sumsq")],
+                    np.concatenate([a["cell"][a["sketch_cell"]], b["cell"][b["sketch_cell"]]]),
+                    np.concatenate([a["sketch_bin"], b["sketch_bin"]]).astype(np.int64),
+                    np.concatenate([a["sketch_count"], b["sketch_count"]]))
+
+
+
+class PriceGrid:
+  """Multi-resolution grid of price statistics; see the module docstring.
+     Build with add_year(conn, year) (or update(conn, years) to add only missing years), save()/load() to reuse."""
+
+  def __init__(self, resolutions=RESOLUTIONS):
+    self.resolutions = tuple(sorted(resolutions))
+    self.layers = {}  # (year, property_type, resolution) -> dict of arrays (see _FIELDS)
+
+  @property
+  def years(self):
+    return sorted(set(year for year, _, _ in self.layers))
+
+  def add_rows(self, year, rows):
+    """Adds (price, latitude, longitude, property_type) rows to `year`, merging with anything already there.
+       Rows without coordinates are skipped."""
+    if not rows:
+      return
+    prices, lats, lons, property_types = zip(*rows)
+    prices = np.array(prices, dtype=np.float64)
+    lats = np.array(lats, dtype=np.float64)
+    lons = np.array(lons, dtype=np.float64)
+    property_types = np.array(property_types, dtype=object)
+    located = ~(np.isnan(lats) | np.isnan(lons) | np.isnan(prices))
+    prices, lats, lons, property_types = prices[located], lats[located], lons[located], property_types[located]
+    x, y = _to_bng(lats, lons)
+    bins = _sketch_bins(prices)
+
+    with span("grid.aggregate", rows=len(prices)):
+      for property_type in np.unique(property_types):
+        of_type = property_types == property_type
+        p = prices[of_type]
+        for resolution in self.resolutions:
+          cells = _cell_keys(x[of_type], y[of_type], resolution)
+          layer = _aggregate(cells, (np.ones_like(p), p, p*p), cells, bins[of_type], np.ones_like(p))
+          key = (year, str(property_type), resolution)
+          self.layers[key] = _merge(self.layers[key], layer) if key in self.layers else layer
+
+  @profiled
+  def add_year(self, conn, year, chunk_size=500000):
+    """Streams a year of prices_coordinates_data into the grid. The table was built a year at a time, so a year
+       is selected by its db_id range (assess.pcd_year_delimiters); only years outside that table fall back to
+       date_of_transfer, which is not indexed."""
+    import pymysql
+    from .assess import pcd_year_delimiters
+    if year in pcd_year_delimiters and year-1 in pcd_year_delimiters:
+      condition = f"db_id BETWEEN {pcd_year_delimiters[year]} AND {pcd_year_delimiters[year-1]-1}"
+    else:
+      condition = f'date_of_transfer BETWEEN "{year}-01-01" AND "{year}-12-31"'
+    cur = conn.cursor(pymysql.cursors.SSCursor)
+    with span("sql.execute"):
+      cur.execute(f"""SELECT price, latitude, longitude, property_type FROM prices_coordinates_data
+                      WHERE {condition}""")
+    try:
+      while True:
+        with span("sql.fetch") as s:
+          rows = cur.fetchmany(chunk_size)
+          s.add(rows=len(rows))
+        if not rows:
+          break
+        self.add_rows(year, rows)
+    finally:
+      cur.close()
+
+  def update(self, conn, years, force=False):
+    """Adds each of `years` that isn't in the grid yet (or all of them, replacing old layers, if force)."""
+    for year in years:
+      if year in self.years:
+        if not force:
+          continue
+        self.drop_year(year)
+      print(f"Gridding prices for year: {year}")
+      self.add_year(conn, year)
+
+  def drop_year(self, year):
+    for key in [key for key in self.layers if key[0] == year]:
+      del self.layers[key]
+
+  def merge(self, other):
+    """Adds the layers of another PriceGrid (e.g. one built for a different year in another process)."""
+    for key, layer in other.layers.items():
+      self.layers[key] = _merge(self.layers[key], layer) if key in self.layers else layer
+    self.resolutions = tuple(sorted(set(self.resolutions) | set(other.resolutions)))
+    return self
+
+  def _query(self, box, cell_filter, years, property_types, resolution, quantiles):
+    """Sums the cells whose centres are in `box` = (x_low, x_high, y_low, y_high) and pass cell_filter(x, y)."""
+    resolution = resolution or self.resolutions[0]
+    count, total, sumsq = 0, 0.0, 0.0
+    histogram = np.zeros(0, dtype=np.int64)
+    for (year, property_type, layer_resolution), layer in self.layers.items():
+      if layer_resolution != resolution or (years is not None and year not in years) \
+         or (property_types is not None and property_type not in property_types):
+        continue
+      candidates = _cells_in_box(layer["cell"], *box, resolution)
+      selected = candidates[cell_filter(*_cell_centres(layer["cell"][candidates], resolution))]
+      count += int(layer["count"][selected].sum())
+      total += float(layer["sum"][selected].sum())
+      sumsq += float(layer["sumsq"][selected].sum())
+      # sketch_cell is sorted too, so each selected cell's histogram entries are one run (searched with
+      # matching dtypes, or numpy would copy the whole of sketch_cell to compare them)
+      sketch_cell, wanted = layer["sketch_cell"], selected.astype(layer["sketch_cell"].dtype)
+      in_sketch = _ranges(np.searchsorted(sketch_cell, wanted, side="left"),
+                          np.searchsorted(sketch_cell, wanted, side="right"))
+      layer_histogram = np.bincount(layer["sketch_bin"][in_sketch], weights=layer["sketch_count"][in_sketch])
+      if len(layer_histogram) > len(histogram):
+        histogram = np.pad(histogram, (0, len(layer_histogram) - len(histogram)))
+      histogram[:len(layer_histogram)] += layer_histogram.astype(np.int64)
+
+    if count == 0:
+      return {"count": 0, "mean": np.nan, "std": np.nan, "median": np.nan, "quantiles": {q: np.nan for q in quantiles}}
+    mean = total / count
+    cumulative = np.cumsum(histogram)
+    def quantile(q):
+      return float(SKETCH_GAMMA ** (np.searchsorted(cumulative, max(q * count, 1)) + 0.5))
+    return {"count": count, "mean": mean, "std": float(np.sqrt(max(sumsq / count - mean**2, 0))),
+            "median": quantile(0.5), "quantiles": {q: quantile(q) for q in quantiles}}
+
+  def bbox(self, north, south, east, west, years=None, property_types=None, resolution=None,
+           quantiles=(0.25, 0.75)):
+    """Price statistics for cells whose centres fall within a lat/lon box (e.g. from access.make_box)."""
+    # the box is (very nearly) a quadrilateral in EPSG:27700, but not axis-aligned, so test each edge
+    corners_x, corners_y = _to_bng([north, north, south, south], [east, west, west, east])
+
+    def within(cx, cy):
+      inside = np.ones(len(cx), dtype=bool)
+      for i in range(4):
+        x0, y0, x1, y1 = corners_x[i], corners_y[i], corners_x[(i+1) % 4], corners_y[(i+1) % 4]
+        inside &= (x1 - x0)*(cy - y0) - (y1 - y0)*(cx - x0) >= 0
+      return inside
+
+    box = (min(corners_x), max(corners_x), min(corners_y), max(corners_y))
+    with span("grid.query"):
+      return self._query(box, within, years, property_types, resolution, quantiles)
+
+  def radius(self, latitude, longitude, radius_km, years=None, property_types=None, resolution=None,
+             quantiles=(0.25, 0.75)):
+    """Price statistics for cells whose centres are within radius_km of (latitude, longitude)."""
+    north, south, east, west = make_box(latitude, longitude, radius_km*2)
+    corners_x, corners_y = _to_bng([north, north, south, south, latitude], [east, west, east, west, longitude])
+    box = (min(corners_x), max(corners_x), min(corners_y), max(corners_y))
+    centre_x, centre_y, radius_m = corners_x[-1], corners_y[-1], radius_km * 1000
+
+    def within(cx, cy):
+      return (cx - centre_x)**2 + (cy - centre_y)**2 <= radius_m**2
+
+    with span("grid.query"):
+      return self._query(box, within, years, property_types, resolution, quantiles)
+
+  def save(self, path):
+    """Writes every layer to a single .npz file."""
+    arrays = {f"{year}/{property_type}/{resolution}/{field}": layer[field]
+              for (year, property_type, resolution), layer in self.layers.items() for field in _FIELDS}
+    arrays["resolutions"] = np.array(self.resolutions)
+    np.savez(path, **arrays)
+    return path
+
+  @classmethod
+  def load(cls, *paths):
+    """Reads (and merges) grids written by save(), e.g. one file per year."""
+    grid = None
+    for path in paths:
+      with np.load(path) as data:
+        part = cls(resolutions=data["resolutions"].tolist())
+        for name in data.files:
+          if name == "resolutions":
+            continue
+          year, property_type, resolution, field = name.split("/")
+          part.layers.setdefault((int(year), property_type, int(resolution)), {})[field] = data[name]
+      grid = part if grid is None else grid.merge(part)
+    return grid if grid is not None else cls()
@@ -0,0 +1,187 @@
+import os
+from array import array
+import numpy as np
+
+# This file holds the compact result type returned by access.get_locations
+
+"""Locations keeps (lat, lon, osm_id, osm_type) as four NumPy columns rather than a list of tuples,
+so that national extracts with millions of objects stay small, can be handed to GeoPandas/Arrow without
+rebuilding Python objects, and can be saved and memory-mapped back as .npy files."""
+
+
+
+OSM_TYPES = ("node", "way", "relation")  # osm_type codes are indices into this
+
+_COLUMNS = (("lat", np.float64), ("lon", np.float64), ("osm_id", np.int64), ("osm_type", np.int8))
+
+# osmium stores coordinates as integers in units of 1e-7 degrees, so buckets of that size
+# reproduce exact (lat, lon) equality.
+DEFAULT_PRECISION = 1e-7
+
+
+def bucket_keys(lat, lon, precision=DEFAULT_PRECISION):
+  """Maps coordinates onto integer spatial buckets `precision` degrees wide; equal keys mean the same bucket."""
+  lat_q = np.rint((np.asarray(lat) + 90) / precision).astype(np.int64)
+  lon_q = np.rint((np.asarray(lon) + 180) / precision).astype(np.int64)
+  return lat_q * (int(round(360 / precision)) + 1) + lon_q
+
+
+
+class Locations:
+  """Columns of lat/lon (float64), osm_id (int64) and osm_type (int8, see OSM_TYPES).
+     Iterating (or indexing) gives (lat, lon) tuples, as the old list-of-tuples result did."""
+  __slots__ = ("lat", "lon", "osm_id", "osm_type")
+
+  def __init__(self, lat, lon, osm_id, osm_type):
+    self.lat = np.asarray(lat, dtype=np.float64)
+    self.lon = np.asarray(lon, dtype=np.float64)
+    self.osm_id = np.asarray(osm_id, dtype=np.int64)
+    self.osm_type = np.asarray(osm_type, dtype=np.int8)
+    if not (len(self.lat) == len(self.lon) == len(self.osm_id) == len(self.osm_type)):
+      raise ValueError("Locations columns must all be the same length.")
+
+  def __len__(self):
+    return len(self.lat)
+
+  def __iter__(self):
+    return zip(self.lat.tolist(), self.lon.tolist())
+
+  def __getitem__(self, i):
+    if isinstance(i, (int, np.integer)):
+      return (float(self.lat[i]), float(self.lon[i]))
+    return Locations(self.lat[i], self.lon[i], self.osm_id[i], self.osm_type[i])
+
+  def __repr__(self):
+    counts = ", ".join(f"{np.count_nonzero(self.osm_type == code)} {name}s" for code, name in enumerate(OSM_TYPES))
+    return f"<Locations: {len(self)} ({counts})>"
+
+  @property
+  def nbytes(self):
+    return sum(getattr(self, name).nbytes for name, _ in _COLUMNS)
+
+  def dedup(self, precision=DEFAULT_PRECISION):
+    """Keeps one location per spatial bucket (the last one added)."""
+    keys = bucket_keys(self.lat, self.lon, precision)[::-1]
+    _, first = np.unique(keys, return_index=True)
+    keep = np.sort(len(self) - 1 - first)
+    return self[keep]
+
+  def to_pandas(self):
+    import pandas as pd
+    return pd.DataFrame({"latitude": self.lat, "longitude": self.lon,
+                         "osm_id": self.osm_id, "osm_type": self.osm_type}, copy=False)
+
+  def to_geopandas(self):
+    """A GeoDataFrame of points in EPSG:4326 (the geometries have to be built, but the other columns are not copied)."""
+    import geopandas as gpd
+    return gpd.GeoDataFrame({"osm_id": self.osm_id, "osm_type": self.osm_type},
+                            geometry=gpd.points_from_xy(self.lon, self.lat), crs="EPSG:4326", copy=False)
+
+  def to_arrow(self):
+    """A pyarrow Table sharing memory with the NumPy columns."""
+    import pyarrow as pa
+    return pa.table({"latitude": self.lat, "longitude": self.lon, "osm_id": self.osm_id, "osm_type": self.osm_type})
+
+  def save(self, directory):
+    """Writes one .npy file per column into `directory`."""
+    os.makedirs(directory, exist_ok=True)
+    for name, _ in _COLUMNS:
+      np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+    return directory
+
+  @classmethod
+  def load(cls, directory, mmap=True):
+    """Reads columns written by save(); by default they are memory-mapped read-only rather than loaded."""
+    return cls(*(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                 for name, _ in _COLUMNS))
+
+
+
+def _as_numpy(buffer, dtype):
+  return np.frombuffer(buffer, dtype=dtype) if len(buffer) else np.empty(0, dtype=dtype)
+
+
+
+class LocationsBuilder:
+  """Accumulates locations into typed arrays while scanning a file, then resolves them into Locations.
+
+     add(...) appends a candidate location; suppress(...) removes any candidate added *before* it in the same
+     bucket (e.g. the nodes of a tagged way, which are probably mistakenly tagged themselves). This gives the
+     same result as the old set arithmetic. Only the buckets of candidates are kept in a set, and a suppression
+     is only logged if its bucket holds a candidate, so memory grows with the number of objects found rather
+     than with the number of nodes scanned."""
+  __slots__ = ("_lat", "_lon", "_osm_id", "_osm_type", "_precision", "_stride", "_keys", "_sup_key", "_sup_pos")
+
+  def __init__(self, precision=DEFAULT_PRECISION):
+    self._lat, self._lon = array("d"), array("d")
+    self._osm_id, self._osm_type = array("q"), array("b")
+    self._precision = precision
+    self._stride = int(round(360 / precision)) + 1
+    self._keys = set()
+    self._sup_key, self._sup_pos = array("q"), array("q")
+
+  def __len__(self):
+    return len(self._lat)
+
+  def _key(self, lat, lon):
+    # the scalar version of bucket_keys (the same arithmetic, so the same buckets)
+    return round((lat + 90) / self._precision) * self._stride + round((lon + 180) / self._precision)
+
+  def add(self, lat, lon, osm_id, osm_type):
+    self._keys.add(self._key(lat, lon))
+    self._lat.append(lat)
+    self._lon.append(lon)
+    self._osm_id.append(osm_id)
+    self._osm_type.append(osm_type)
+
+  def suppress(self, lat, lon):
+    key = self._key(lat, lon)
+    if key in self._keys:
+      self._sup_key.append(key)
+      self._sup_pos.append(len(self._lat))
+
+  def build(self):
+    locations = Locations(_as_numpy(self._lat, np.float64), _as_numpy(self._lon, np.float64),
+                          _as_numpy(self._osm_id, np.int64), _as_numpy(self._osm_type, np.int8))
+    if len(self._sup_pos):
+      unique_keys, inverse = np.unique(_as_numpy(self._sup_key, np.int64), return_inverse=True)
+      latest = np.full(len(unique_keys), -1, dtype=np.int64)
+      np.maximum.at(latest, inverse, _as_numpy(self._sup_pos, np.int64))
+
+      keys = bucket_keys(locations.lat, locations.lon, self._precision)
+      slot = np.minimum(np.searchsorted(unique_keys, keys), len(unique_keys) - 1)
+      suppressed = (unique_keys[slot] == keys) & (np.arange(len(keys)) < latest[slot])
+      locations = locations[~suppressed]
+    return locations.dedup(self._precision)
+
+
+
+class WayLocations:
+  """A compact stand-in for a {way_id: (lat, lon)} dict: ids and coordinates live in typed arrays, and lookups
+     use a sorted index built on first use (ways precede relations in .osm.pbf files, so that is built once)."""
+  __slots__ = ("_ids", "_lat", "_lon", "_order", "_sorted_ids")
+
+  def __init__(self):
+    self._ids, self._lat, self._lon = array("q"), array("d"), array("d")
+    self._order = self._sorted_ids = None
+
+  def __len__(self):
+    return len(self._ids)
+
+  def __setitem__(self, way_id, lat_lon):
+    if self._order is not None:
+      self._order = self._sorted_ids = None  # the sorted index is stale now
+    self._ids.append(way_id)
+    self._lat.append(lat_lon[0])
+    self._lon.append(lat_lon[1])
+
+  def __getitem__(self, way_id):
+    if self._order is None:
+      ids = _as_numpy(self._ids, np.int64)
+      self._order = np.argsort(ids, kind="stable")
+      self._sorted_ids = ids[self._order]
+    i = np.searchsorted(self._sorted_ids, way_id, side="right") - 1
+    if i < 0 or self._sorted_ids[i] != way_id:
+      raise KeyError(way_id)
+    j = self._order[i]
+    return (self._lat[j], self._lon[j])
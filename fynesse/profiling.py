@@ -0,0 +1,193 @@
+import contextlib
+import functools
+import io
+import json
+import threading
+import time
+from .other.config import config
+
+# This file records where the time goes
+
+"""Lightweight timing spans and row/byte counters for the access/assess/address pipeline.
+Switched on with `profiling: true` in the config (or `profiling.enable()`); otherwise every span is a no-op
+apart from a single flag check. Set `profiling_hook` to "cprofile" or "pyinstrument" to also profile each
+top-level call."""
+
+
+
+HOOKS = (None, "cprofile", "pyinstrument")
+
+
+def _check_hook(hook):
+  if hook not in HOOKS:
+    raise ValueError(f"Unknown profiling hook {hook!r}; expected one of {HOOKS}.")
+  return hook
+
+
+_enabled = bool(config.get("profiling", False))
+_hook = _check_hook(config.get("profiling_hook"))
+_stats = {}     # span name -> {"calls", "seconds", "rows", "bytes"}
+_profiles = {}  # top-level call name -> text output of the last profile taken
+_lock = threading.Lock()
+_local = threading.local()
+_KEEP_HOOK = object()
+
+
+def enable(hook=_KEEP_HOOK):
+  """Starts recording spans. `hook` may be None, "cprofile" or "pyinstrument"; if not given,
+     the configured `profiling_hook` (or whatever was last enabled) is kept."""
+  global _enabled, _hook
+  if hook is not _KEEP_HOOK:
+    _hook = _check_hook(hook)
+  _enabled = True
+
+
+def disable():
+  global _enabled
+  _enabled = False
+
+
+def is_enabled():
+  return _enabled
+
+
+def reset():
+  """Forgets all spans and profiles recorded so far."""
+  with _lock:
+    _stats.clear()
+    _profiles.clear()
+
+
+class _Counter:
+  """Yielded by `span`, so that the body can report how many rows/bytes it handled."""
+  __slots__ = ("rows", "bytes")
+
+  def __init__(self):
+    self.rows = 0
+    self.bytes = 0
+
+  def add(self, rows=0, nbytes=0):
+    self.rows += rows
+    self.bytes += nbytes
+
+
+def _record(name, seconds, rows, nbytes):
+  with _lock:
+    entry = _stats.setdefault(name, {"calls": 0, "seconds": 0.0, "rows": 0, "bytes": 0})
+    entry["calls"] += 1
+    entry["seconds"] += seconds
+    entry["rows"] += rows
+    entry["bytes"] += nbytes
+
+
+@contextlib.contextmanager
+def span(name, rows=0, nbytes=0):
+  """Times the enclosed block under `name` (e.g. "sql.execute", "wkt.parse", "network.fetch").
+     Use as `with span("sql.fetch") as s: rows = cur.fetchall(); s.add(rows=len(rows))`."""
+  counter = _Counter()
+  counter.add(rows, nbytes)
+  if not _enabled:
+    yield counter
+    return
+  start = time.perf_counter()
+  try:
+    yield counter
+  finally:
+    _record(name, time.perf_counter() - start, counter.rows, counter.bytes)
+
+
+def _run_with_hook(name, func, args, kwargs):
+  if _hook == "pyinstrument":
+    try:
+      from pyinstrument import Profiler
+    except ImportError as e:
+      print(f"pyinstrument unavailable, so not profiling {name}: {e}")
+      return func(*args, **kwargs)
+    profiler = Profiler()
+    profiler.start()
+    try:
+      return func(*args, **kwargs)
+    finally:
+      profiler.stop()
+      text = profiler.output_text()
+      with _lock:
+        _profiles[name] = text
+
+  import cProfile
+  import pstats
+  profiler = cProfile.Profile()
+  try:
+    return profiler.runcall(func, *args, **kwargs)
+  finally:
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(25)
+    with _lock:
+      _profiles[name] = text.getvalue()
+
+
+def profiled(func):
+  """Decorator for top-level calls: records a span named after the function, and (if a hook is configured)
+     profiles it, as long as it is not already running inside another profiled call."""
+  name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+  @functools.wraps(func)
+  def wrapper(*args, **kwargs):
+    if not _enabled:
+      return func(*args, **kwargs)
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    try:
+      with span(name):
+        if _hook and depth == 0:
+          return _run_with_hook(name, func, args, kwargs)
+        return func(*args, **kwargs)
+    finally:
+      _local.depth = depth
+
+  return wrapper
+
+
+def summary():
+  """Returns a dict of {span name: {calls, seconds, rows, bytes}}, slowest first."""
+  with _lock:
+    return dict(sorted(((name, dict(entry)) for name, entry in _stats.items()),
+                       key=lambda item: item[1]["seconds"], reverse=True))
+
+
+def report(show_profiles=False):
+  """Prints a table of the recorded spans, slowest first."""
+  stats = summary()
+  if not stats:
+    print("No spans recorded (is profiling enabled?).")
+    return
+  width = max(len(name) for name in stats)
+  print(f"{'span':<{width}}  {'calls':>7}  {'total s':>9}  {'mean ms':>9}  {'rows':>11}  {'MB':>9}")
+  for name, entry in stats.items():
+    print(f"{name:<{width}}  {entry['calls']:>7}  {entry['seconds']:>9.3f}  "
+          f"{1000*entry['seconds']/entry['calls']:>9.2f}  {entry['rows']:>11}  {entry['bytes']/1e6:>9.2f}")
+  if show_profiles:
+    for name, text in _profiles.items():
+      print(f"\n===== {name} =====\n{text}")
+
+
+def export_json(path):
+  """Writes the recorded spans (and any profiles) to `path` as JSON."""
+  with open(path, "w") as f:
+    with _lock:
+      profiles = dict(_profiles)
+    json.dump({"spans": summary(), "profiles": profiles}, f, indent=2)
+  return path
+
+
+def import_json(path, label=None):
+  """Adds the spans (and profiles) from a file written by export_json, e.g. by a worker process,
+     to those recorded here. Profiles are renamed "name [label]" if a label is given."""
+  with open(path) as f:
+    data = json.load(f)
+  with _lock:
+    for name, entry in data["spans"].items():
+      merged = _stats.setdefault(name, {"calls": 0, "seconds": 0.0, "rows": 0, "bytes": 0})
+      for key in merged:
+        merged[key] += entry[key]
+    for name, text in data.get("profiles", {}).items():
+      _profiles[name if label is None else f"{name} [{label}]"] = text
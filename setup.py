@@ -34,9 +34,10 @@ REQUIRED = [
 # What packages are optional?
 EXTRAS = {
     "interactive html plots": ["bokeh",],
+    "parquet output from the command-line runner": ["pyarrow",],
 }
 
-PACKAGE_DATA = {"fynesse": ["defaults.yml"]}
+PACKAGE_DATA = {"fynesse": ["other/defaults.yml"]}
 
 # The rest you shouldn't have to touch too much :)
 # ------------------------------------------------
@@ -116,9 +117,9 @@ setup(
     # If your package is a single module, use this instead of "packages":
     # py_modules=["mypackage"],
 
-    # entry_points={
-    #     "console_scripts": ["mycli=mymodule:cli"],
-    # },
+    entry_points={
+        "console_scripts": ["fynesse=fynesse.cli:main"],
+    },
     install_requires=REQUIRED,
     extras_require=EXTRAS,
     include_package_data=True,
@@ -0,0 +1,52 @@
+import pytest
+
+
+class FakeCursor:
+  """Records every query on its connection, and answers each from the connection's canned results."""
+
+  def __init__(self, connection):
+    self.connection = connection
+    self.rows = []
+
+  def execute(self, query, args=None):
+    self.connection.queries.append(query)
+    self.connection.args.append(args)
+    self.rows = list(next((rows for match, rows in self.connection.results.items() if match in query), []))
+
+  def fetchone(self):
+    return self.rows.pop(0) if self.rows else None
+
+  def fetchall(self):
+    rows, self.rows = self.rows, []
+    return rows
+
+  def fetchmany(self, size):
+    rows, self.rows = self.rows[:size], self.rows[size:]
+    return rows
+
+  def close(self):
+    pass
+
+
+class FakeConnection:
+  """Stands in for a pymysql connection. `results` maps a substring of a query to the rows it returns."""
+
+  def __init__(self, results=None):
+    self.results = results or {}
+    self.queries = []
+    self.args = []
+
+  def cursor(self, *args):
+    return FakeCursor(self)
+
+  def commit(self):
+    pass
+
+  def close(self):
+    pass
+
+
+@pytest.fixture
+def fake_connection():
+  """The FakeConnection class, to build connections with canned results."""
+  return FakeConnection
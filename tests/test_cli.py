@@ -0,0 +1,75 @@
+import argparse
+import json
+import pytest
+from fynesse import cli, profiling
+
+
+@pytest.fixture(autouse=True)
+def fresh_profiling():
+  was_enabled, hook = profiling.is_enabled(), profiling._hook
+  yield
+  profiling.reset()
+  profiling.enable(hook)
+  if not was_enabled:
+    profiling.disable()
+
+
+loaded = []
+
+
+def select_stub(year, csv_file_path):
+  if year == 2019:
+    raise RuntimeError("no data")
+  with profiling.span("test.select", rows=year):
+    return csv_file_path
+
+
+def load_stub(year, csv_file_path):
+  with profiling.span("test.load", rows=1):
+    loaded.append(year)
+  return "prices_coordinates_data"
+
+
+def square_or_fail(n):
+  if n < 0:
+    raise ValueError("negative")
+  return n * n
+
+
+def test_parse_year_range():
+  assert cli.parse_year_range("2018-2020") == [2018, 2019, 2020]
+  assert cli.parse_year_range("2015") == [2015]
+  for bad in ("2020-2018", "twenty", "2018-2019-2020"):
+    with pytest.raises(argparse.ArgumentTypeError):
+      cli.parse_year_range(bad)
+  assert cli.parse_years([[2020], [2018, 2019, 2020]]) == [2018, 2019, 2020]
+
+
+def test_parser_rejects_reversed_range(capsys):
+  with pytest.raises(SystemExit):
+    cli.build_parser().parse_args(["ingest", "2021-2019"])
+  assert "reversed year range" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_run_jobs_returns_only_succeeded(jobs):
+  succeeded = cli.run_jobs(jobs, square_or_fail, [(2,), (-1,), (3,)])
+  assert sorted(succeeded) == [(2,), (3,)]
+
+
+def test_ingest_loads_one_at_a_time_newest_first_and_merges_profiles(monkeypatch, tmp_path):
+  monkeypatch.setattr(cli, "run_ingest_select", select_stub)
+  monkeypatch.setattr(cli, "run_ingest_load", load_stub)
+  loaded.clear()
+  profile = str(tmp_path / "out.json")
+  with open(profile, "w") as f:
+    f.write("stale")  # left by an earlier run: replaced, not merged
+
+  assert cli.main(["--jobs", "3", "--profile", profile, "ingest", "2018-2021"]) == 1  # 2019 failed
+  assert loaded == [2021, 2020, 2018]
+
+  with open(profile) as f:
+    spans = json.load(f)["spans"]
+  assert spans["test.select"]["calls"] == 3 and spans["test.select"]["rows"] == 2018 + 2020 + 2021
+  assert spans["test.load"]["calls"] == 3
+  assert sorted(path.name for path in tmp_path.iterdir()) == ["out.json"]  # the per-job parts are removed
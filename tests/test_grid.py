@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from fynesse.grid import PriceGrid, _to_bng
+
+
+@pytest.fixture(scope="module")
+def sales():
+  rng = np.random.default_rng(0)
+  n = 300000
+  lat, lon = 51.5 + rng.normal(0, 0.05, n), -0.12 + rng.normal(0, 0.08, n)
+  price = np.exp(rng.normal(12.5, 0.6, n)).round()
+  property_type = rng.choice(list("DSTFO"), n)
+  return lat, lon, price, property_type
+
+
+@pytest.fixture(scope="module")
+def grid(sales):
+  lat, lon, price, property_type = sales
+  rows = list(zip(price.tolist(), lat.tolist(), lon.tolist(), property_type.tolist()))
+  grid = PriceGrid()
+  # loaded in two parts (plus a row with no coordinates), to exercise merging into an existing year
+  grid.add_rows(2020, rows[:150000])
+  grid.add_rows(2020, rows[150000:] + [(100000.0, None, None, "D")])
+  return grid
+
+
+def test_radius_matches_brute_force(sales, grid):
+  lat, lon, price, _ = sales
+  x, y = _to_bng(lat, lon)
+  centre_x, centre_y = _to_bng([51.5], [-0.12])
+  inside = (x - centre_x[0])**2 + (y - centre_y[0])**2 <= 2000**2
+
+  result = grid.radius(51.5, -0.12, 2)
+  assert result["count"] == pytest.approx(inside.sum(), rel=0.001)
+  assert result["mean"] == pytest.approx(price[inside].mean(), rel=0.001)
+  assert result["std"] == pytest.approx(price[inside].std(), rel=0.01)
+  assert result["median"] == pytest.approx(np.median(price[inside]), rel=0.005)
+  for q, value in result["quantiles"].items():
+    assert value == pytest.approx(np.quantile(price[inside], q), rel=0.02)
+
+
+def test_bbox_matches_brute_force(sales, grid):
+  lat, lon, _, property_type = sales
+  inside = (lat <= 51.52) & (lat >= 51.48) & (lon <= -0.1) & (lon >= -0.14) & (property_type == "D")
+  assert grid.bbox(51.52, 51.48, -0.1, -0.14, property_types=["D"])["count"] == pytest.approx(inside.sum(), rel=0.01)
+
+
+def test_extreme_quantiles(sales, grid):
+  lat, lon, price, _ = sales
+  result = grid.radius(51.5, -0.12, 100, quantiles=(0, 1))
+  assert result["count"] == len(price)
+  assert result["quantiles"][0] == pytest.approx(price.min(), rel=0.02)
+  assert result["quantiles"][1] == pytest.approx(price.max(), rel=0.02)
+
+
+def test_empty_region(grid):
+  result = grid.radius(60, -0.12, 1)
+  assert result["count"] == 0 and np.isnan(result["median"])
+
+
+def test_save_load_and_incremental_years(grid, tmp_path):
+  other = PriceGrid()
+  other.add_rows(2021, [(250000.0, 51.5, -0.12, "T")])
+  loaded = PriceGrid.load(grid.save(str(tmp_path / "2020.npz")), other.save(str(tmp_path / "2021.npz")))
+  assert loaded.years == [2020, 2021]
+  assert loaded.radius(51.5, -0.12, 2, years=[2020])["count"] == grid.radius(51.5, -0.12, 2)["count"]
+  assert loaded.radius(51.5, -0.12, 2, years=[2021])["count"] == 1
+
+
+def test_add_year_selects_by_db_id_where_possible(fake_connection):
+  from fynesse.assess import pcd_year_delimiters
+  conn = fake_connection()
+  PriceGrid().add_year(conn, 2020)
+  PriceGrid().add_year(conn, 2025)
+  assert f"db_id BETWEEN {pcd_year_delimiters[2020]} AND {pcd_year_delimiters[2019]-1}" in conn.queries[0]
+  assert "date_of_transfer" not in conn.queries[0]
+  assert 'date_of_transfer BETWEEN "2025-01-01"' in conn.queries[1]
+
+
+
+def test_query_time_independent_of_grid_size():
+  import time
+  from fynesse.grid import _cell_centres
+  rng = np.random.default_rng(1)
+  national = PriceGrid(resolutions=(100,))
+  # 10 years of ~1M occupied 100 m cells each, spread over GB's extent in EPSG:27700 (7000 x 12000 cells)
+  for year in range(2015, 2025):
+    cells = np.sort(rng.integers(0, 7000, 1000000) * (1 << 32) + rng.integers(0, 12000, 1000000) + (1 << 31))
+    cells = cells[np.concatenate([[True], cells[1:] != cells[:-1]])]
+    n = len(cells)
+    national.layers[(year, "D", 100)] = {
+      "cell": cells, "count": np.ones(n, dtype=np.int64), "sum": np.full(n, 250000.0),
+      "sumsq": np.full(n, 250000.0**2), "sketch_cell": np.arange(n, dtype=np.int32),
+      "sketch_bin": np.full(n, 627, dtype=np.int16), "sketch_count": np.ones(n, dtype=np.int64)}
+
+  def best_of(query, repeats=5):
+    times = []
+    for _ in range(repeats):
+      start = time.perf_counter()
+      result = query()
+      times.append(time.perf_counter() - start)
+    return min(times), result
+
+  seconds, result = best_of(lambda: national.radius(51.5, -0.12, 2))
+  centre_x, centre_y = _to_bng([51.5], [-0.12])
+  expected = 0
+  for layer in national.layers.values():
+    x, y = _cell_centres(layer["cell"], 100)
+    expected += int(((x - centre_x[0])**2 + (y - centre_y[0])**2 <= 2000**2).sum())
+  assert result["count"] == expected > 0
+  assert seconds < 0.005  # scanning all ~10M cells took ~250 ms
+
+  seconds, result = best_of(lambda: national.bbox(51.52, 51.48, -0.1, -0.14))
+  assert result["count"] > 0 and seconds < 0.005
@@ -0,0 +1,84 @@
+import random
+import numpy as np
+import pytest
+from fynesse.locations import Locations, LocationsBuilder, WayLocations, bucket_keys
+
+
+def reference_locations(events):
+  """The set arithmetic get_locations used before Locations: ("add", point) adds a point; ("object", points)
+     removes any of `points` already added, then adds the first (a tagged way or multipolygon relation)."""
+  locations = set()
+  for kind, value in events:
+    if kind == "add":
+      locations.add(value)
+    else:
+      locations -= set(value)
+      locations.add(value[0])
+  return locations
+
+
+def build(events):
+  builder = LocationsBuilder()
+  for i, (kind, value) in enumerate(events):
+    if kind == "add":
+      builder.add(*value, i, 0)
+    else:
+      for point in value:
+        builder.suppress(*point)
+      builder.add(*value[0], i, 1)
+  return builder, builder.build()
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_builder_matches_set_arithmetic(seed):
+  rng = random.Random(seed)
+  # a handful of nearby osmium-style coordinates (whole multiples of 1e-7 degrees), so collisions are common
+  points = [(round(51.5 + rng.randint(0, 5)*1e-7, 7), round(-0.1 + rng.randint(0, 5)*1e-7, 7)) for _ in range(8)]
+  events = []
+  for _ in range(rng.randint(0, 15)):
+    if rng.random() < 0.5:
+      events.append(("add", rng.choice(points)))
+    else:
+      events.append(("object", rng.sample(points, rng.randint(1, 4))))
+
+  _, locations = build(events)
+  expected = reference_locations(events)
+  assert len(locations) == len(expected)
+  assert set(locations) == expected
+
+
+def test_suppressions_only_logged_for_candidate_buckets():
+  events = [("add", (51.5, -0.1)), ("object", [(52.0, 1.0), (52.0, 1.1), (51.5, -0.1)])]
+  builder, locations = build(events)
+  assert len(builder._sup_key) == 1  # only (51.5, -0.1) shares a bucket with an earlier candidate
+  assert set(locations) == {(52.0, 1.0)}
+
+
+def test_scalar_and_vector_bucket_keys_agree():
+  rng = np.random.default_rng(0)
+  lat, lon = rng.uniform(49, 61, 1000).round(7), rng.uniform(-8, 2, 1000).round(7)
+  builder = LocationsBuilder()
+  assert [builder._key(a, b) for a, b in zip(lat.tolist(), lon.tolist())] == bucket_keys(lat, lon).tolist()
+
+
+def test_empty_builder():
+  assert len(LocationsBuilder().build()) == 0
+
+
+def test_save_and_load_memory_mapped(tmp_path):
+  locations = Locations([51.5, 52.0], [-0.1, 1.0], [1, 2], [0, 1])
+  loaded = Locations.load(locations.save(str(tmp_path / "locations")))
+  assert list(loaded) == list(locations)
+  assert loaded.osm_id.tolist() == [1, 2] and loaded.osm_type.tolist() == [0, 1]
+  assert loaded[1] == (52.0, 1.0)
+
+
+def test_way_locations():
+  ways = WayLocations()
+  ways[5] = (1.0, 2.0)
+  ways[3] = (3.0, 4.0)
+  assert ways[5] == (1.0, 2.0) and ways[3] == (3.0, 4.0)
+  ways[9] = (5.0, 6.0)  # added after a lookup: the index must be rebuilt
+  assert ways[9] == (5.0, 6.0)
+  with pytest.raises(KeyError):
+    ways[4]
@@ -0,0 +1,74 @@
+import pytest
+from fynesse import profiling
+
+
+@pytest.fixture(autouse=True)
+def fresh_profiling():
+  was_enabled, hook = profiling.is_enabled(), profiling._hook
+  profiling.reset()
+  yield
+  profiling.reset()
+  profiling.enable(hook)
+  if not was_enabled:
+    profiling.disable()
+
+
+@profiling.profiled
+def inner(n):
+  with profiling.span("test.inner", rows=n):
+    return n
+
+
+@profiling.profiled
+def outer(n):
+  return inner(n) + inner(n)
+
+
+def test_spans_count_calls_rows_and_bytes():
+  profiling.enable(None)
+  with profiling.span("test.span", rows=2) as s:
+    s.add(rows=3, nbytes=10)
+  with profiling.span("test.span"):
+    pass
+  stats = profiling.summary()["test.span"]
+  assert (stats["calls"], stats["rows"], stats["bytes"]) == (2, 5, 10)
+
+
+def test_disabled_spans_record_nothing():
+  profiling.disable()
+  with profiling.span("test.span"):
+    pass
+  assert outer(1) == 2
+  assert profiling.summary() == {}
+
+
+def test_hook_only_profiles_outermost_call():
+  profiling.enable("cprofile")
+  outer(4)
+  stats = profiling.summary()
+  assert stats["test_profiling.outer"]["calls"] == 1
+  assert stats["test_profiling.inner"]["calls"] == 2
+  assert stats["test.inner"]["rows"] == 8
+  assert list(profiling._profiles) == ["test_profiling.outer"]
+
+
+def test_enable_keeps_hook_and_rejects_unknown_ones():
+  profiling.enable("cprofile")
+  profiling.enable()
+  assert profiling._hook == "cprofile"
+  with pytest.raises(ValueError):
+    profiling.enable("yappi")
+  assert profiling._hook == "cprofile"
+
+
+def test_export_import_round_trip(tmp_path):
+  profiling.enable("cprofile")
+  outer(1)
+  path = profiling.export_json(str(tmp_path / "worker.json"))
+  expected = profiling.summary()
+  profiling.import_json(path, label="2020")
+  merged = profiling.summary()
+  for name, entry in expected.items():
+    assert merged[name]["calls"] == 2 * entry["calls"]
+    assert merged[name]["rows"] == 2 * entry["rows"]
+  assert set(profiling._profiles) == {"test_profiling.outer", "test_profiling.outer [2020]"}
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from fynesse.access import _tsv_column, disable_indexes, rebuild_indexes, upload_dataframe
+
+
+def index_row(key, seq, column, non_unique=1, sub_part=None, collation="A", index_type="BTREE"):
+  return {"Key_name": key, "Seq_in_index": seq, "Column_name": column, "Non_unique": non_unique,
+          "Sub_part": sub_part, "Collation": collation, "Index_type": index_type}
+
+
+def test_tsv_column_booleans_and_infinities():
+  assert _tsv_column(pd.Series([True, False, None], dtype="boolean")).tolist() == ["1", "0", "\\N"]
+  assert _tsv_column(pd.Series([True, False, None], dtype=object)).tolist() == ["1", "0", "\\N"]
+  assert _tsv_column(pd.Series([1.5, np.inf, -np.inf, np.nan])).tolist() == ["1.5", "\\N", "\\N", "\\N"]
+  assert _tsv_column(pd.Series(["a\tb", "c\\d", None])).tolist() == ["a\\tb", "c\\\\d", "\\N"]
+
+
+def test_innodb_secondary_indexes_dropped_and_rebuilt(fake_connection, capsys):
+  indexes = [index_row("PRIMARY", 1, "db_id", non_unique=0), index_row("ux", 1, "code", non_unique=0),
+             index_row("ix_pc", 2, "date", collation="D"), index_row("ix_pc", 1, "postcode", sub_part=4),
+             index_row("sx_geom", 1, "geometry", index_type="SPATIAL")]
+  conn = fake_connection({"information_schema": [{"ENGINE": "InnoDB"}], "SHOW INDEX": indexes})
+  state = disable_indexes(conn, "t")
+  restore = ("ALTER TABLE `t` ADD INDEX `ix_pc` (`postcode`(4), `date` DESC), "
+             "ADD SPATIAL INDEX `sx_geom` (`geometry`);")
+  # printed before anything is dropped, so the indexes can be restored by hand if the load dies
+  assert restore in capsys.readouterr().out
+  assert [q for q in conn.queries if "DROP" in q] == ["ALTER TABLE `t` DROP INDEX `ix_pc`",
+                                                      "ALTER TABLE `t` DROP INDEX `sx_geom`"]
+  rebuild_indexes(conn, state)
+  assert conn.queries[-1] == restore
+
+
+def test_failed_rebuild_reports_restore_statement(fake_connection, capsys):
+  class FailingCursor:
+    def execute(self, query, args=None):
+      raise RuntimeError("connection lost")
+
+  conn = fake_connection()
+  conn.cursor = lambda *args: FailingCursor()
+  with pytest.raises(RuntimeError):
+    rebuild_indexes(conn, {"table": "t", "engine": "InnoDB", "dropped": ["ADD INDEX `ix` (`a`)"]})
+  assert "ALTER TABLE `t` ADD INDEX `ix` (`a`);" in capsys.readouterr().out
+
+
+def test_myisam_uses_disable_keys(fake_connection):
+  conn = fake_connection({"information_schema": [{"ENGINE": "Aria"}]})
+  rebuild_indexes(conn, disable_indexes(conn, "t"))
+  assert conn.queries[1:] == ["ALTER TABLE `t` DISABLE KEYS", "ALTER TABLE `t` ENABLE KEYS"]
+
+
+def test_geometry_srid_defaults_to_crs(fake_connection, tmp_path):
+  import geopandas as gpd
+  from shapely.geometry import Point
+  gdf = gpd.GeoDataFrame({"name": ["a"]}, geometry=[Point(530000, 180000)], crs="EPSG:27700")
+  conn = fake_connection()
+  assert upload_dataframe(conn, gdf, "t", tmp_dir=str(tmp_path))["rows"] == 1
+  assert "ST_GeomFromWKB(UNHEX(@geom_wkb), 27700)" in conn.queries[0]
+  assert list(tmp_path.iterdir()) == []
+
+
+def test_skip_checks_restores_previous_session_values(fake_connection, tmp_path):
+  conn = fake_connection({"SELECT @@SESSION": [(1, 0)]})
+  upload_dataframe(conn, pd.DataFrame({"a": [1, 2]}), "t", skip_checks=True, tmp_dir=str(tmp_path))
+  assert conn.queries[1] == "SET SESSION unique_checks = 0, foreign_key_checks = 0"
+  assert conn.queries[-1] == "SET SESSION unique_checks = %s, foreign_key_checks = %s"
+  assert conn.args[-1] == (1, 0)
+
+
+def test_disable_keys_alone_keeps_checks(fake_connection, tmp_path):
+  conn = fake_connection({"information_schema": [{"ENGINE": "InnoDB"}]})
+  upload_dataframe(conn, pd.DataFrame({"a": [1, 2]}), "t", disable_keys=True, tmp_dir=str(tmp_path))
+  assert not any("unique_checks" in query for query in conn.queries)